@@ -0,0 +1,3 @@
+The c-ares resolver's ``getaddrinfo`` now honors ``AI_ADDRCONFIG``
+for ``AF_UNSPEC`` lookups: when the host has no non-loopback,
+non-link-local IPv6 address, only IPv4 addresses are looked up.
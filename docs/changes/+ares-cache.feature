@@ -0,0 +1,7 @@
+The c-ares resolver now caches the results of ``gethostbyname_ex``
+and ``getaddrinfo``. Successful lookups are kept for the number of
+seconds given by the new ``resolver_cache_ttl`` setting (environment
+variable ``GEVENT_RESOLVER_CACHE_TTL``), 60 by default, regardless of
+the TTL of the DNS records; lookups of names that don't exist are kept
+for at most 10 seconds. Set it to 0, or pass ``cache_ttl=0`` to the
+resolver, to disable caching.
@@ -0,0 +1,3 @@
+The c-ares resolver's ``getaddrinfo`` now answers numeric IPv4 and
+IPv6 addresses with the system ``getaddrinfo`` instead of c-ares.
+Like the system resolver, it may include ``SOCK_RAW`` results for them.
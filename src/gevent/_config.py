@@ -684,6 +684,28 @@ class ResolverTimeout(FloatSettingMixin, AresSettingMixin, Setting):
     def kwarg_name(self):
         return 'timeout'
 
+
+class ResolverCacheTTL(FloatSettingMixin, Setting):
+    document = True
+    name = 'resolver_cache_ttl'
+    environment_key = 'GEVENT_RESOLVER_CACHE_TTL'
+    default = 60.0
+    desc = """\
+    The number of seconds that successful lookups are cached by the resolver.
+
+    Failed lookups (for names that do not exist) are cached for the
+    smaller of this value and 10 seconds. A value of 0 disables caching.
+
+    Only the ares resolver supports this.
+
+    .. versionadded:: NEXT
+    """
+
+    def validate(self, value):
+        if value is not None and value < 0:
+            raise ValueError("Must not be negative")
+        return value
+
 config = Config()
 
 # Go ahead and attempt to import the loop when this class is
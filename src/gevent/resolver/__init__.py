@@ -37,6 +37,26 @@ __all__ = ()
 u'foo'.encode('idna')
 
 
+def _encode_hostname(hostname, encoding='idna'):
+    """
+    Encode the text *hostname* to bytes using *encoding*.
+
+    Nearly all hostnames are short, plain ASCII, which the ``idna``
+    codec would pass through unchanged after checking the length of
+    each label. Those names take the much cheaper ASCII path instead.
+    """
+    if (
+            len(hostname) < 64 # No label can be too long
+            and u'..' not in hostname # or empty
+            and not hostname.startswith(u'.')
+    ):
+        try:
+            return hostname.encode('ascii')
+        except UnicodeEncodeError:
+            pass
+    return hostname.encode(encoding)
+
+
 def _lookup_port(port, socktype):
     # pylint:disable=too-many-branches
     socktypes = []
@@ -98,19 +118,24 @@ def _resolve_special(hostname, family):
 
 class AbstractResolver(object):
 
+    # Let subclasses use __slots__ for their per-instance state.
+    __slots__ = ()
+
     HOSTNAME_ENCODING = 'idna' if PY3 else 'ascii'
 
-    _LOCAL_HOSTNAMES = (
+    # These are checked on every call, so use sets for
+    # constant-time membership tests.
+    _LOCAL_HOSTNAMES = frozenset((
         b'localhost',
         b'ip6-localhost',
         b'::1',
         b'127.0.0.1',
-    )
+    ))
 
-    _LOCAL_AND_BROADCAST_HOSTNAMES = _LOCAL_HOSTNAMES + (
+    _LOCAL_AND_BROADCAST_HOSTNAMES = _LOCAL_HOSTNAMES | frozenset((
         b'255.255.255.255',
         b'<broadcast>',
-    )
+    ))
 
     EAI_NONAME_MSG = (
         'nodename nor servname provided, or not known'
@@ -152,10 +177,15 @@ class AbstractResolver(object):
         return resolve
 
     def _hostname_to_bytes(self, hostname):
-        if isinstance(hostname, text_type):
-            hostname = hostname.encode(self.HOSTNAME_ENCODING)
-        elif not isinstance(hostname, (bytes, bytearray)):
-            raise TypeError('Expected str, bytes or bytearray, not %s' % type(hostname).__name__)
+        # Exact type checks first; they're cheaper than isinstance()
+        # and cover nearly every call. Subclasses fall through.
+        kind = type(hostname)
+        if kind is bytes:
+            return hostname
+        if kind is text_type or isinstance(hostname, text_type):
+            return _encode_hostname(hostname, self.HOSTNAME_ENCODING)
+        if not isinstance(hostname, (bytes, bytearray)):
+            raise TypeError('Expected str, bytes or bytearray, not %s' % kind.__name__)
 
         return bytes(hostname)
 
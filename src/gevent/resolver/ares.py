@@ -4,15 +4,32 @@ c-ares based hostname resolver.
 """
 from __future__ import absolute_import, print_function, division
 import os
+import sys
+from collections import OrderedDict
 
 from _socket import gaierror
 from _socket import herror
 from _socket import error
 from _socket import EAI_NONAME
+from _socket import AI_NUMERICHOST
+from _socket import AI_NUMERICSERV
+from _socket import AI_ADDRCONFIG
+from _socket import has_ipv6
+from _socket import getaddrinfo as native_getaddrinfo
+try:
+    from _socket import inet_pton
+except ImportError: # pragma: no cover
+    # Windows on Python 2
+    inet_pton = None
+try:
+    from _socket import EAI_NODATA
+except ImportError: # pragma: no cover
+    EAI_NODATA = EAI_NONAME
 
 from gevent._compat import text_type
 from gevent._compat import integer_types
 from gevent._compat import PY3
+from gevent._compat import monotonic
 
 from gevent.hub import Waiter
 from gevent.hub import get_hub
@@ -30,12 +47,187 @@ from gevent._config import config
 from gevent._config import AresSettingMixin
 
 from .cares import channel, InvalidIP # pylint:disable=import-error,no-name-in-module
+from .cares import ares_host_result # pylint:disable=import-error,no-name-in-module
+from .cares import Result # pylint:disable=import-error,no-name-in-module
 from . import _lookup_port as lookup_port
+from . import _encode_hostname as encode_hostname
 from . import AbstractResolver
+from ._addresses import is_ipv4_addr
+from ._addresses import is_ipv6_addr
 
 __all__ = ['Resolver']
 
 
+def _is_numeric_host(host_bytes):
+    # inet_pton is implemented in C and is much cheaper than
+    # the parsers in gevent.resolver._addresses; this runs on every lookup.
+    if inet_pton is None: # pragma: no cover
+        return is_ipv4_addr(host_bytes) or is_ipv6_addr(host_bytes)
+    host = host_bytes.decode('latin-1') if PY3 else host_bytes
+    for family in (AF_INET, AF_INET6):
+        try:
+            inet_pton(family, host)
+        except (error, ValueError):
+            continue
+        return True
+    return False
+
+# {int: bytes} for the ports that have been looked up. There are
+# at most 65535 of them.
+_PORT_BYTES = {}
+
+def _port_to_bytes(port):
+    if type(port) is not int: # pylint:disable=unidiomatic-typecheck
+        # Subclasses such as bool or IntEnum hash like the plain int
+        # but may format differently; don't let them into the memo.
+        return str(port).encode('ascii')
+    try:
+        return _PORT_BYTES[port]
+    except KeyError:
+        port_bytes = str(port).encode('ascii')
+        if 0 < port < 65536:
+            _PORT_BYTES[port] = port_bytes
+        return port_bytes
+
+# Sent to greenlets waiting on a lookup that was abandoned.
+_RETRY = object()
+
+def _make_result(value, error):
+    # Each greenlet sharing a lookup gets its own exception
+    # instance; raising one instance in several greenlets would chain
+    # all of their tracebacks onto it.
+    if error is None:
+        return Result(value)
+    exc_type, args = error
+    try:
+        return Result(None, exc_type(*args))
+    except Exception: # pylint:disable=broad-except
+        # Can't be rebuilt from its args; let the follower
+        # do its own lookup.
+        return Result(_RETRY)
+
+# The loopback (host) and link-local scopes in /proc/net/if_inet6
+_IPV6_LOCAL_SCOPES = (0x10, 0x20)
+
+def _probe_ipv6_addresses():
+    """
+    Return whether the host has an IPv6 address that is neither
+    loopback nor link-local, which is what ``AI_ADDRCONFIG`` asks.
+
+    Where we can't list the addresses, assume there is one so that
+    lookups are not restricted.
+    """
+    if not has_ipv6:
+        return False
+    try:
+        # Each line is: address ifindex prefixlen scope flags name
+        with open('/proc/net/if_inet6') as f:
+            lines = f.readlines()
+    except (IOError, OSError):
+        # On Linux, a missing file means IPv6 is disabled.
+        return not sys.platform.startswith('linux')
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 4 and int(fields[3], 16) not in _IPV6_LOCAL_SCOPES:
+            return True
+    return False
+
+# Computed when AI_ADDRCONFIG is used, and again after
+# _IPV6_PROBE_INTERVAL seconds, since interfaces may come and go.
+_HAVE_IPV6 = None
+_HAVE_IPV6_EXPIRES = 0
+_IPV6_PROBE_INTERVAL = 10.0
+
+def _have_ipv6():
+    global _HAVE_IPV6, _HAVE_IPV6_EXPIRES
+    now = monotonic()
+    if _HAVE_IPV6 is None or now >= _HAVE_IPV6_EXPIRES:
+        _HAVE_IPV6 = _probe_ipv6_addresses()
+        _HAVE_IPV6_EXPIRES = now + _IPV6_PROBE_INTERVAL
+    return _HAVE_IPV6
+
+
+def _compute_hard_type_proto(socktype, proto):
+    # The SOL_* constants are another (older?) name for IPPROTO_*
+    if socktype:
+        hard_type_proto = (
+            (socktype, SOL_TCP if socktype == SOCK_STREAM else SOL_UDP),
+        )
+    elif proto:
+        hard_type_proto = (
+            (SOCK_STREAM if proto == SOL_TCP else SOCK_DGRAM, proto),
+        )
+    else:
+        hard_type_proto = (
+            (SOCK_STREAM, SOL_TCP),
+            (SOCK_DGRAM, SOL_UDP),
+        )
+    return hard_type_proto
+
+#: The ``(socktype, proto)`` pairs that ``getaddrinfo`` fills in
+#: for results, precomputed for the requested ``(socktype, proto)``
+#: combinations that are actually valid. Anything else is computed
+#: on each call and not stored.
+_HARD_TYPE_PROTO = {
+    key: _compute_hard_type_proto(*key)
+    for key in (
+        (0, 0),
+        (SOCK_STREAM, 0),
+        (SOCK_STREAM, SOL_TCP),
+        (SOCK_DGRAM, 0),
+        (SOCK_DGRAM, SOL_UDP),
+        (0, SOL_TCP),
+        (0, SOL_UDP),
+    )
+}
+
+
+class _DNSCache(object):
+    """
+    A bounded LRU mapping of lookup keys to results, where
+    each entry expires after a given number of seconds.
+
+    Failures are stored as the arguments of the exception
+    so that a new exception is raised for each cache hit.
+    """
+
+    __slots__ = ('_entries', 'maxsize')
+
+    def __init__(self, maxsize=1024):
+        self._entries = OrderedDict()
+        self.maxsize = maxsize
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, now):
+        """
+        Return ``(is_error, value)`` for *key*, or None if there
+        is no entry or it has expired.
+        """
+        entries = self._entries
+        try:
+            expires, is_error, value = entries[key]
+        except KeyError:
+            return None
+        if expires <= now:
+            del entries[key]
+            return None
+        # Mark it as most recently used.
+        entries[key] = entries.pop(key)
+        return is_error, value
+
+    def set(self, key, value, ttl, now, is_error=False):
+        entries = self._entries
+        entries.pop(key, None)
+        entries[key] = (now + ttl, is_error, value)
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
 class Resolver(AbstractResolver):
     """
     Implementation of the resolver API using the `c-ares`_ library.
@@ -62,7 +254,9 @@ class Resolver(AbstractResolver):
     - ``gethostbyname_ex`` may return the ``ipaddrlist`` in a
       different order.
 
-    - ``getaddrinfo`` does not return ``SOCK_RAW`` results.
+    - ``getaddrinfo`` does not return ``SOCK_RAW`` results, except
+      for numeric addresses, which are answered by the system
+      ``getaddrinfo``.
 
     - ``getaddrinfo`` may return results in a different order.
 
@@ -116,15 +310,62 @@ class Resolver(AbstractResolver):
 
        Handling of localhost and broadcast names is now more consistent.
 
+    .. versionchanged:: NEXT
+       Results of ``gethostbyname_ex`` and ``getaddrinfo`` are cached
+       for *cache_ttl* seconds (by default, the
+       :attr:`gevent._config.Config.resolver_cache_ttl` setting). Names that
+       don't exist are cached for at most ``NEGATIVE_CACHE_TTL`` seconds.
+       Pass ``cache_ttl=0`` to disable this.
+
+       ``getaddrinfo`` answers numeric IPv4 and IPv6 addresses
+       with the system ``getaddrinfo``, without using c-ares. Like the
+       system resolver, it may return ``SOCK_RAW`` results for them.
+
+       Concurrent identical lookups of ``gethostbyname_ex`` and
+       ``getaddrinfo`` share a single query.
+
+       ``getaddrinfo`` honors ``AI_ADDRCONFIG`` for ``AF_UNSPEC``
+       lookups, querying only for IPv4 addresses when the host has
+       no non-loopback, non-link-local IPv6 address.
+
     .. _c-ares: http://c-ares.haxx.se
     """
 
+    __slots__ = (
+        'hub',
+        'cares',
+        'pid',
+        'params',
+        'fork_watcher',
+        'cache_ttl',
+        '_cache',
+        '_inflight',
+        '_waiter_pool',
+        # Instances could always be weakly referenced; keep that.
+        '__weakref__',
+    )
+
     cares_class = channel
 
-    def __init__(self, hub=None, use_environ=True, **kwargs):
+    #: The maximum number of seconds that lookups of
+    #: names that don't exist are cached.
+    NEGATIVE_CACHE_TTL = 10.0
+
+    def __init__(self, hub=None, use_environ=True, cache_ttl=None, **kwargs):
         if hub is None:
             hub = get_hub()
         self.hub = hub
+        if cache_ttl is None:
+            cache_ttl = (
+                config.resolver_cache_ttl
+                if use_environ
+                else config.settings['resolver_cache_ttl'].default
+            ) or 0
+        self.cache_ttl = cache_ttl
+        self._cache = _DNSCache()
+        # {key: [Waiter]} for lookups that are in progress.
+        self._inflight = {}
+        self._waiter_pool = []
         if use_environ:
             for setting in config.settings.values():
                 if isinstance(setting, AresSettingMixin):
@@ -144,23 +385,126 @@ class Resolver(AbstractResolver):
         # NOTE: See comment in gevent.hub.reinit.
         pid = os.getpid()
         if pid != self.pid:
+            self._cache.clear()
             self.hub.loop.run_callback(self.cares.destroy)
             self.cares = self.cares_class(self.hub.loop, **self.params)
             self.pid = pid
 
     def close(self):
+        self._cache.clear()
         if self.cares is not None:
             self.hub.loop.run_callback(self.cares.destroy)
             self.cares = None
         self.fork_watcher.stop()
 
+    #: The most idle :class:`Waiter` objects to keep for reuse.
+    WAITER_POOL_SIZE = 64
+
+    def _get_waiter(self):
+        pool = self._waiter_pool
+        return pool.pop() if pool else Waiter(self.hub)
+
+    def _wait(self, waiter):
+        result = waiter.get()
+        # Only a waiter whose callback has delivered a value is
+        # known to be finished with. If ``get`` raised, the callback may
+        # still be pending (e.g., we were killed), so let it go.
+        pool = self._waiter_pool
+        if len(pool) < self.WAITER_POOL_SIZE:
+            waiter.clear()
+            pool.append(waiter)
+        return result
+
+    def _cached(self, key, func, *args):
+        """
+        Return the result of ``func(*args)``, taking it from the cache
+        if possible.
+
+        While one greenlet is calling *func* for a *key*, other greenlets
+        wanting the same *key* wait for and share its result instead of
+        starting their own query.
+        """
+        cache_ttl = self.cache_ttl
+        if cache_ttl:
+            entry = self._cache.get(key, monotonic())
+            if entry is not None:
+                is_error, value = entry
+                if is_error:
+                    raise gaierror(*value)
+                return value
+
+        inflight = self._inflight
+        followers = inflight.get(key)
+        if followers is not None:
+            waiter = self._get_waiter()
+            followers.append(waiter)
+            result = self._wait(waiter)
+            if result is _RETRY:
+                # The greenlet doing the lookup was killed or timed out.
+                return self._cached(key, func, *args)
+            return result
+
+        followers = inflight[key] = []
+        value = _RETRY
+        error = None
+        try:
+            result = value = func(*args)
+        except gaierror as ex:
+            error = (type(ex), ex.args)
+            if cache_ttl and ex.args and ex.args[0] in (EAI_NONAME, EAI_NODATA):
+                self._cache.set(key, ex.args,
+                                min(cache_ttl, self.NEGATIVE_CACHE_TTL),
+                                monotonic(),
+                                is_error=True)
+            raise
+        except Exception as ex: # pylint:disable=broad-except
+            error = (type(ex), ex.args)
+            raise
+        finally:
+            del inflight[key]
+            run_callback = self.hub.loop.run_callback
+            for waiter in followers:
+                run_callback(waiter, _make_result(value, error))
+
+        if cache_ttl:
+            self._cache.set(key, result, cache_ttl, monotonic())
+        return result
+
     def _gethostbyname_ex(self, hostname_bytes, family):
+        result = self._cached((hostname_bytes, family),
+                              self.__gethostbyname_ex, hostname_bytes, family)
+        # Don't share the mutable lists of a cached result.
+        return ares_host_result(result.family,
+                                (result[0], list(result[1]), list(result[2])))
+
+    def _call_with_fork_retry(self, exc_type, func, *args):
+        """
+        Return ``func(*args)``, calling it again if it raises *exc_type*
+        because the channel was destroyed and replaced after a fork.
+
+        This is for use as the function given to :meth:`_cached`, where it
+        takes the place of a dedicated retry method. Elsewhere, the
+        loop is written inline to save a call.
+        """
+        while True:
+            ares = self.cares
+            try:
+                return func(*args)
+            except exc_type:
+                # "self.cares is not ares" means channel was destroyed
+                # (because we were forked)
+                if ares is self.cares:
+                    raise
+
+    def __gethostbyname_ex(self, hostname_bytes, family):
+        # The fork-retry loop is inline here rather than using
+        # _call_with_fork_retry to avoid the extra call on this hot path.
         while True:
             ares = self.cares
             try:
-                waiter = Waiter(self.hub)
+                waiter = self._get_waiter()
                 ares.gethostbyname(waiter, hostname_bytes, family)
-                result = waiter.get()
+                result = self._wait(waiter)
                 if not result[-1]:
                     raise herror(EAI_NONAME, self.EAI_NONAME_MSG)
                 return result
@@ -190,7 +534,7 @@ class Resolver(AbstractResolver):
         """
         # pylint:disable=too-many-locals,too-many-branches
         if isinstance(host, text_type):
-            host = host.encode('idna')
+            host = encode_hostname(host)
 
 
         if isinstance(port, text_type):
@@ -199,9 +543,9 @@ class Resolver(AbstractResolver):
             if port == 0:
                 port = None
             else:
-                port = str(port).encode('ascii')
+                port = _port_to_bytes(port)
 
-        waiter = Waiter(self.hub)
+        waiter = self._get_waiter()
         self.cares.getaddrinfo(
             waiter,
             host,
@@ -217,7 +561,7 @@ class Resolver(AbstractResolver):
         # (address, port)
         # and INET6 is
         # (address, port, flow info, scope id)
-        result = waiter.get()
+        result = self._wait(waiter)
 
         if not result:
             raise gaierror(EAI_NONAME, self.EAI_NONAME_MSG)
@@ -227,62 +571,76 @@ class Resolver(AbstractResolver):
             # ever. It's at least supposed to do that if they were given as
             # hints, but it doesn't (https://github.com/c-ares/c-ares/issues/317)
             # Sigh.
-            # The SOL_* constants are another (older?) name for IPPROTO_*
-            if socktype:
-                hard_type_proto = [
-                    (socktype, SOL_TCP if socktype == SOCK_STREAM else SOL_UDP),
-                ]
-            elif proto:
-                hard_type_proto = [
-                    (SOCK_STREAM if proto == SOL_TCP else SOCK_DGRAM, proto),
+            hard_type_proto = _HARD_TYPE_PROTO.get((socktype, proto))
+            if hard_type_proto is None:
+                hard_type_proto = _compute_hard_type_proto(socktype, proto)
+
+            if len(hard_type_proto) == 1:
+                # The common case when a socktype or proto was
+                # requested: one output entry per input entry, so
+                # there's no need for the nested loop.
+                ((hard_type, hard_proto),) = hard_type_proto
+                result = [
+                    (rfamily,
+                     rtype or hard_type,
+                     rproto or hard_proto,
+                     rcanon,
+                     raddr)
+                    for rfamily, rtype, rproto, rcanon, raddr
+                    in result
                 ]
             else:
-                hard_type_proto = [
-                    (SOCK_STREAM, SOL_TCP),
-                    (SOCK_DGRAM, SOL_UDP),
+                result = [
+                    (rfamily,
+                     rtype or hard_type,
+                     rproto or hard_proto,
+                     rcanon,
+                     raddr)
+                    for rfamily, rtype, rproto, rcanon, raddr
+                    in result
+                    for hard_type, hard_proto
+                    in hard_type_proto
                 ]
-
-            result = [
-                (rfamily,
-                 hard_type if not rtype else rtype,
-                 hard_proto if not rproto else rproto,
-                 rcanon,
-                 raddr)
-                for rfamily, rtype, rproto, rcanon, raddr
-                in result
-                for hard_type, hard_proto
-                in hard_type_proto
-            ]
         return result
 
     def _getaddrinfo(self, host_bytes, port, family, socktype, proto, flags):
-        while True:
-            ares = self.cares
-            try:
-                return self.__getaddrinfo(host_bytes, port, family, socktype, proto, flags)
-            except gaierror:
-                if ares is self.cares:
-                    raise
+        if (
+                (port is None or isinstance(port, integer_types))
+                and _is_numeric_host(host_bytes)
+        ):
+            # Numeric addresses need no network access and no
+            # trip through the channel; the native function can answer
+            # them directly without consulting any files.
+            return native_getaddrinfo(host_bytes, port, family, socktype, proto,
+                                      flags | AI_NUMERICHOST | AI_NUMERICSERV)
+        if family == AF_UNSPEC and flags & AI_ADDRCONFIG and not _have_ipv6():
+            # c-ares ignores AI_ADDRCONFIG, and would query for AAAA
+            # records we can't use.
+            family = AF_INET
+        return list(self._cached(
+            (host_bytes, port, family, socktype, proto, flags),
+            self._call_with_fork_retry, gaierror, self.__getaddrinfo,
+            host_bytes, port, family, socktype, proto, flags))
 
     def __gethostbyaddr(self, ip_address):
-        waiter = Waiter(self.hub)
+        waiter = self._get_waiter()
         try:
             self.cares.gethostbyaddr(waiter, ip_address)
-            return waiter.get()
+            return self._wait(waiter)
         except InvalidIP:
             result = self._getaddrinfo(ip_address, None,
                                        family=AF_UNSPEC, socktype=SOCK_DGRAM,
                                        proto=0, flags=0)
             if not result:
                 raise
-            _ip_address = result[0][-1][0]
-            if isinstance(_ip_address, text_type):
-                _ip_address = _ip_address.encode('ascii')
+            # Addresses in our own getaddrinfo results are always
+            # native strings.
+            _ip_address = result[0][-1][0].encode('ascii')
             if _ip_address == ip_address:
                 raise
             waiter.clear()
             self.cares.gethostbyaddr(waiter, _ip_address)
-            return waiter.get()
+            return self._wait(waiter)
 
     def _gethostbyaddr(self, ip_address_bytes):
         while True:
@@ -310,9 +668,9 @@ class Resolver(AbstractResolver):
         elif family == AF_INET6:
             address = address[:2] + sockaddr[2:]
 
-        waiter = Waiter(self.hub)
+        waiter = self._get_waiter()
         self.cares.getnameinfo(waiter, address, flags)
-        node, service = waiter.get()
+        node, service = self._wait(waiter)
 
         if service is None and PY3:
             # ares docs: "If the query did not complete
@@ -320,9 +678,7 @@ class Resolver(AbstractResolver):
             # requested, node or service will be NULL ". Python 2
             # allows that for the service, but Python 3 raises
             # an error. This is tested by test_socket in py 3.4
-            err = gaierror(EAI_NONAME, self.EAI_NONAME_MSG)
-            err.errno = EAI_NONAME
-            raise err
+            raise gaierror(EAI_NONAME, self.EAI_NONAME_MSG)
 
         return node, service or '0'
 
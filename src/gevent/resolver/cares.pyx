@@ -627,6 +627,10 @@ cdef class channel:
         cdef sockaddr_in* sadr4
         cdef sockaddr_in6* sadr6
         cdef object canonname = ''
+        # Typed so that appending each node and building its
+        # sockaddr compile to direct C-API calls.
+        cdef list addrs
+        cdef tuple sockaddr
 
         cdef channel channel
         cdef object callback
@@ -0,0 +1,140 @@
+from __future__ import print_function
+
+import unittest
+from _socket import gaierror
+from _socket import EAI_NONAME
+
+import gevent
+import gevent.testing as greentest
+try:
+    from gevent.resolver.ares import Resolver
+    from gevent.resolver.ares import _DNSCache
+except ImportError: # pragma: no cover
+    Resolver = None
+
+
+@unittest.skipIf(
+    Resolver is None,
+    "Needs ares resolver"
+)
+class TestDNSCache(greentest.TestCase):
+
+    def test_expires(self):
+        cache = _DNSCache()
+        cache.set('key', 'value', 10, now=0)
+        self.assertEqual(cache.get('key', 5), (False, 'value'))
+        self.assertIsNone(cache.get('key', 10))
+        self.assertEqual(len(cache), 0)
+
+    def test_lru(self):
+        cache = _DNSCache(maxsize=2)
+        cache.set('a', 1, 10, 0)
+        cache.set('b', 2, 10, 0)
+        cache.get('a', 0)
+        cache.set('c', 3, 10, 0)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b', 0))
+        self.assertEqual(cache.get('a', 0), (False, 1))
+        self.assertEqual(cache.get('c', 0), (False, 3))
+
+
+@unittest.skipIf(
+    Resolver is None,
+    "Needs ares resolver"
+)
+class TestResolverCache(greentest.TestCase):
+
+    def _makeOne(self, cache_ttl):
+        resolver = Resolver(cache_ttl=cache_ttl)
+        self._close_on_teardown(resolver.close)
+        return resolver
+
+    def test_positive(self):
+        resolver = self._makeOne(60)
+        calls = []
+        def lookup(arg):
+            calls.append(arg)
+            return [arg]
+
+        self.assertEqual(resolver._cached('key', lookup, 1), [1])
+        self.assertEqual(resolver._cached('key', lookup, 2), [1])
+        self.assertEqual(calls, [1])
+
+    def test_close_clears_cache(self):
+        resolver = self._makeOne(60)
+        resolver._cached('key', lambda: [1])
+        self.assertEqual(len(resolver._cache), 1)
+        resolver.close()
+        self.assertEqual(len(resolver._cache), 0)
+
+    def test_negative(self):
+        resolver = self._makeOne(60)
+        calls = []
+        def lookup():
+            calls.append(1)
+            raise gaierror(EAI_NONAME, 'Name or service not known')
+
+        for _ in range(2):
+            with self.assertRaises(gaierror) as exc:
+                resolver._cached('key', lookup)
+            self.assertEqual(exc.exception.args[0], EAI_NONAME)
+        self.assertEqual(calls, [1])
+
+    def test_disabled(self):
+        resolver = self._makeOne(0)
+        calls = []
+        def lookup():
+            calls.append(1)
+
+        resolver._cached('key', lookup)
+        resolver._cached('key', lookup)
+        self.assertEqual(calls, [1, 1])
+
+    def test_concurrent_lookups_share_query(self):
+        resolver = self._makeOne(0)
+        calls = []
+        def lookup(arg):
+            calls.append(arg)
+            gevent.sleep(0.01)
+            return [arg]
+
+        glets = [gevent.spawn(resolver._cached, 'key', lookup, i)
+                 for i in range(3)]
+        gevent.joinall(glets, raise_error=True)
+        self.assertEqual(calls, [0])
+        self.assertEqual([g.value for g in glets], [[0]] * 3)
+        self.assertEqual(resolver._inflight, {})
+
+    def test_shared_failure_not_shared_exception(self):
+        resolver = self._makeOne(0)
+        def lookup():
+            gevent.sleep(0.01)
+            raise gaierror(EAI_NONAME, 'Name or service not known')
+
+        glets = [gevent.spawn(resolver._cached, 'key', lookup)
+                 for _ in range(3)]
+        gevent.joinall(glets)
+        errors = [g.exception for g in glets]
+        for error in errors:
+            self.assertIsInstance(error, gaierror)
+            self.assertEqual(error.args[0], EAI_NONAME)
+        self.assertEqual(len(set(id(e) for e in errors)), 3)
+
+    def test_abandoned_lookup_retried(self):
+        resolver = self._makeOne(0)
+        calls = []
+        def lookup(arg):
+            calls.append(arg)
+            gevent.sleep(0.01)
+            return [arg]
+
+        leader = gevent.spawn(resolver._cached, 'key', lookup, 0)
+        follower = gevent.spawn(resolver._cached, 'key', lookup, 1)
+        gevent.sleep(0)
+        leader.kill()
+        self.assertEqual(follower.get(), [1])
+        self.assertEqual(calls, [0, 1])
+
+
+if __name__ == '__main__':
+    greentest.main()
@@ -0,0 +1,143 @@
+from __future__ import print_function
+
+import unittest
+import weakref
+from _socket import getaddrinfo as native_getaddrinfo
+from _socket import AF_UNSPEC
+from _socket import AF_INET
+from _socket import AI_ADDRCONFIG
+from _socket import EAI_NONAME
+from _socket import gaierror
+from _socket import AF_INET6
+from _socket import AI_NUMERICHOST
+from _socket import SOCK_STREAM
+
+import gevent.testing as greentest
+try:
+    from gevent.resolver import ares
+    from gevent.resolver.ares import Resolver
+except ImportError: # pragma: no cover
+    Resolver = None
+
+
+class _NoQueryChannel(object):
+    # Stands in for the c-ares channel; any query fails
+    # the test.
+
+    def destroy(self):
+        pass
+
+    def __getattr__(self, name):
+        raise AssertionError("Unexpected use of the channel: %s" % (name,))
+
+
+@unittest.skipIf(
+    Resolver is None,
+    "Needs ares resolver"
+)
+class TestNumericHosts(greentest.TestCase):
+
+    def _makeOne(self):
+        resolver = Resolver(cache_ttl=0)
+        self._close_on_teardown(resolver.close)
+        resolver.cares.destroy()
+        resolver.cares = _NoQueryChannel()
+        return resolver
+
+    def _check(self, host, port, *args):
+        resolver = self._makeOne()
+        result = resolver.getaddrinfo(host, port, *args)
+        expected = native_getaddrinfo(host, port, *args)
+        self.assertEqual(result, expected)
+
+    def test_ipv4(self):
+        self._check('10.0.0.1', 80)
+
+    def test_ipv4_socktype(self):
+        self._check('10.0.0.1', 80, AF_UNSPEC, SOCK_STREAM)
+
+    def test_ipv6(self):
+        self._check('2001:db8::1', 443)
+
+    def test_ipv6_no_port(self):
+        self._check('2001:db8::1', None, AF_INET6)
+
+    def test_numeric_host_flag_still_native(self):
+        self._check('10.0.0.1', 0, AF_UNSPEC, 0, 0, AI_NUMERICHOST)
+
+
+class _QueryRecordingChannel(_NoQueryChannel):
+
+    def __init__(self):
+        self.queries = []
+
+    def getaddrinfo(self, callback, name, service, family=0, type=0, proto=0, flags=0):
+        # pylint:disable=redefined-builtin
+        self.queries.append((name, family))
+        raise gaierror(EAI_NONAME, 'Name or service not known')
+
+
+@unittest.skipIf(
+    Resolver is None,
+    "Needs ares resolver"
+)
+class TestAddrConfig(greentest.TestCase):
+
+    def setUp(self):
+        super(TestAddrConfig, self).setUp()
+        self.orig_have_ipv6 = ares._HAVE_IPV6, ares._HAVE_IPV6_EXPIRES
+        ares._HAVE_IPV6 = False
+        ares._HAVE_IPV6_EXPIRES = float('inf')
+
+    def tearDown(self):
+        ares._HAVE_IPV6, ares._HAVE_IPV6_EXPIRES = self.orig_have_ipv6
+        super(TestAddrConfig, self).tearDown()
+
+    def _lookup(self, family, flags):
+        resolver = Resolver(cache_ttl=0)
+        self._close_on_teardown(resolver.close)
+        resolver.cares.destroy()
+        resolver.cares = channel = _QueryRecordingChannel()
+        with self.assertRaises(gaierror):
+            resolver.getaddrinfo('www.example.com', 80, family, 0, 0, flags)
+        return channel.queries
+
+    def test_unspec_without_ipv6_uses_inet(self):
+        self.assertEqual(self._lookup(AF_UNSPEC, AI_ADDRCONFIG),
+                         [(b'www.example.com', AF_INET)])
+
+    def test_unspec_without_flag_unchanged(self):
+        self.assertEqual(self._lookup(AF_UNSPEC, 0),
+                         [(b'www.example.com', AF_UNSPEC)])
+
+    def test_inet6_unchanged(self):
+        self.assertEqual(self._lookup(AF_INET6, AI_ADDRCONFIG),
+                         [(b'www.example.com', AF_INET6)])
+
+
+@unittest.skipIf(
+    Resolver is None,
+    "Needs ares resolver"
+)
+class TestPortToBytes(greentest.TestCase):
+
+    def test_int_subclass_does_not_poison_memo(self):
+        self.assertEqual(ares._port_to_bytes(True), b'True')
+        self.assertEqual(ares._port_to_bytes(1), b'1')
+        self.assertEqual(ares._port_to_bytes(1), b'1')
+
+
+@unittest.skipIf(
+    Resolver is None,
+    "Needs ares resolver"
+)
+class TestResolverInstance(greentest.TestCase):
+
+    def test_weakref(self):
+        resolver = Resolver()
+        self._close_on_teardown(resolver.close)
+        self.assertIs(weakref.ref(resolver)(), resolver)
+
+
+if __name__ == '__main__':
+    greentest.main()